@@ -0,0 +1,255 @@
+import heapq
+from itertools import count
+
+import numpy as np
+
+# D* Lite (Koenig, Likhachev) searches backwards from the goal and keeps g/rhs values
+# between calls, so moving the start along the path or changing a few edge costs only
+# repairs the part of the search tree that depends on them.
+#
+# The heuristic has to be consistent for the km key modifier to stay correct,
+# Manhattan distance from a_star.py overestimates l2 weights so l2 is used here.
+# With l2 heuristic and l2 weights keys often tie exactly, so keys are compared
+# with KEY_EPSILON to keep float noise from ending the search early.
+
+KEY_EPSILON = 1e-9
+
+
+class NoPathException(Exception):
+    pass
+
+
+def heuristic(a, b):
+    return np.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def key_less(key1, key2):
+    if key1[0] < key2[0] - KEY_EPSILON:
+        return True
+    if key1[0] > key2[0] + KEY_EPSILON:
+        return False
+    return key1[1] < key2[1] - KEY_EPSILON
+
+
+class DStarLite:
+    def __init__(self, graph, start, goal, edge_costs=None, is_report=False):
+        self.graph = graph
+        self.start = start
+        self.goal = goal
+        self.last_start = start
+        self.is_report = is_report
+        # overrides on top of graph costs, float('inf') marks a removed edge
+        self.edge_costs = dict(edge_costs) if edge_costs else {}
+        self.km = 0
+        self.g = {}
+        self.rhs = {goal: 0}
+        self.frontier = []
+        self.frontier_keys = {}
+        self.counter = count()
+        self.expansions = 0
+        self.last_expansions = 0
+        self.push(goal)
+
+    def cost(self, from_location, to_location):
+        if (from_location, to_location) in self.edge_costs:
+            return self.edge_costs[(from_location, to_location)]
+        return self.graph.cost(from_location, to_location)
+
+    # closed obstacle polygons leave zero weight self loops in Graph, they would pin rhs to a stale g
+    def neighbors(self, location):
+        return [neighbor for neighbor in self.graph.neighbors(location) if neighbor != location]
+
+    def get_g(self, location):
+        return self.g.get(location, float('inf'))
+
+    def get_rhs(self, location):
+        return self.rhs.get(location, float('inf'))
+
+    def calc_key(self, location):
+        value = min(self.get_g(location), self.get_rhs(location))
+        return value + heuristic(self.start, location) + self.km, value
+
+    def push(self, location):
+        key = self.calc_key(location)
+        self.frontier_keys[location] = key
+        heapq.heappush(self.frontier, (key, next(self.counter), location))
+
+    # entries whose key no longer matches frontier_keys are stale and skipped lazily
+    def top(self):
+        while self.frontier:
+            key, _, location = self.frontier[0]
+            if self.frontier_keys.get(location) == key:
+                return key, location
+            heapq.heappop(self.frontier)
+        return (float('inf'), float('inf')), None
+
+    def update_vertex(self, location):
+        if location != self.goal:
+            self.rhs[location] = min([self.cost(location, neighbor) + self.get_g(neighbor)
+                                      for neighbor in self.neighbors(location)], default=float('inf'))
+        self.frontier_keys.pop(location, None)
+        if self.get_g(location) != self.get_rhs(location):
+            self.push(location)
+
+    def compute_shortest_path(self):
+        expansions = 0
+        while True:
+            key, location = self.top()
+            if location is None or (not key_less(key, self.calc_key(self.start))
+                                    and self.get_rhs(self.start) == self.get_g(self.start)):
+                break
+            new_key = self.calc_key(location)
+            if key_less(key, new_key):
+                self.push(location)
+                continue
+            del self.frontier_keys[location]
+            expansions += 1
+            if self.get_g(location) > self.get_rhs(location):
+                self.g[location] = self.rhs[location]
+                for neighbor in self.neighbors(location):
+                    self.update_vertex(neighbor)
+            else:
+                self.g[location] = float('inf')
+                self.update_vertex(location)
+                for neighbor in self.neighbors(location):
+                    self.update_vertex(neighbor)
+        self.expansions += expansions
+        self.last_expansions = expansions
+
+    def move_start(self, start):
+        self.start = start
+
+    # km only catches up with the moved start when costs change, as in the paper
+    def update_edge(self, from_location, to_location, cost):
+        if self.start != self.last_start:
+            self.km += heuristic(self.last_start, self.start)
+            self.last_start = self.start
+        self.edge_costs[(from_location, to_location)] = cost
+        self.edge_costs[(to_location, from_location)] = cost
+        self.update_vertex(from_location)
+        self.update_vertex(to_location)
+
+    def remove_edge(self, from_location, to_location):
+        self.update_edge(from_location, to_location, float('inf'))
+
+    def full_search_expansions(self):
+        planner = DStarLite(self.graph, self.start, self.goal, self.edge_costs)
+        planner.compute_shortest_path()
+        return planner.last_expansions
+
+    def find_shortest_path(self):
+        self.compute_shortest_path()
+        if self.is_report:
+            print('replan expansions', self.last_expansions, 'full re-search expansions', self.full_search_expansions())
+        if self.get_g(self.start) == float('inf'):
+            raise NoPathException
+
+        path = [self.start]
+        while path[-1] != self.goal:
+            current = path[-1]
+            path.append(min(self.neighbors(current),
+                            key=lambda neighbor: self.cost(current, neighbor) + self.get_g(neighbor)))
+        return path, self.get_g(self.start)
+
+
+if __name__ == '__main__':
+    import json
+    from dijkstra import find_shortest_path
+    from graph import Graph
+    from graph_explorer import GraphExplorer
+
+    g = GraphExplorer({
+        'start': [0, 0],
+        'finish': [10, 10],
+        'obstacles': [[[2, 2], [2, 4], [3, 3]], [[5, 4], [4, 6], [6, 5], [7, 4]]]
+    }).graph
+    planner = DStarLite(g, (0, 0), (10, 10))
+    path, cost = planner.find_shortest_path()
+    assert (path == [(0, 0), (2, 4), (4, 6), (10, 10)])
+    assert (np.allclose(cost, find_shortest_path(g, (0, 0), (10, 10))[1]))
+
+    # robot advanced, nothing changed: the tree is still valid
+    planner.move_start((2, 4))
+    assert (planner.find_shortest_path()[0] == [(2, 4), (4, 6), (10, 10)])
+    assert (planner.last_expansions == 0)
+
+    planner.remove_edge((4, 6), (10, 10))
+    path, cost = planner.find_shortest_path()
+    assert (path[0] == (2, 4) and path[-1] == (10, 10) and path[-2] != (4, 6))
+    fresh = DStarLite(g, (2, 4), (10, 10), planner.edge_costs)
+    assert (np.allclose(cost, fresh.find_shortest_path()[1]))
+
+    line = Graph()
+    line.add_edge((0, 0), (1, 0))
+    line.add_edge((1, 0), (2, 0))
+    planner = DStarLite(line, (0, 0), (2, 0))
+    assert (planner.find_shortest_path()[1] == 2)
+    planner.remove_edge((1, 0), (2, 0))
+    try:
+        planner.find_shortest_path()
+        assert (False)
+    except NoPathException:
+        assert (True)
+
+    with open('tests/robot-test-15.json') as json_file:
+        data = json.load(json_file)
+    start, finish = tuple(data['start']), tuple(data['finish'])
+    g = GraphExplorer(data, edge_limiter_name='auto').graph
+    planner = DStarLite(g, start, finish)
+    path, cost = planner.find_shortest_path()
+    assert (np.allclose(cost, find_shortest_path(g, start, finish)[1]))
+
+    planner.move_start(path[1])
+    path, cost = planner.find_shortest_path()
+    assert (np.allclose(cost, find_shortest_path(g, path[0], finish)[1]))
+    assert (planner.last_expansions < planner.full_search_expansions())
+
+    planner.update_edge(path[1], path[2], 10 * planner.cost(path[1], path[2]))
+    path, cost = planner.find_shortest_path()
+    fresh = DStarLite(g, path[0], finish, planner.edge_costs)
+    assert (np.allclose(cost, fresh.find_shortest_path()[1]))
+    assert (planner.last_expansions < fresh.last_expansions)
+
+
+    # dijkstra on the same graph with the planner's cost overrides
+    class OverriddenGraph:
+        def __init__(self, planner):
+            self.planner = planner
+
+        def neighbors(self, location):
+            return self.planner.neighbors(location)
+
+        def cost(self, from_location, to_location):
+            return self.planner.cost(from_location, to_location)
+
+
+    import random
+    with open('tests/robot-test-50.json') as json_file:
+        data = json.load(json_file)
+    start, finish = tuple(data['start']), tuple(data['finish'])
+    g = GraphExplorer(data, edge_limiter_name='auto').graph
+    for seed in range(20):
+        rng = random.Random(seed)
+        planner = DStarLite(g, start, finish)
+        path, cost = planner.find_shortest_path()
+        while len(path) > 2:
+            planner.move_start(path[1])
+            index = rng.randrange(1, len(path) - 1)
+            if rng.random() < 0.3:
+                planner.remove_edge(path[index], path[index + 1])
+            else:
+                planner.update_edge(path[index], path[index + 1],
+                                    (1 + rng.random()) * planner.cost(path[index], path[index + 1]))
+            try:
+                path, cost = planner.find_shortest_path()
+            except NoPathException:
+                # removals can cut the goal off, dijkstra then never reaches it with a finite cost
+                try:
+                    assert (find_shortest_path(OverriddenGraph(planner), planner.start, finish)[1] == float('inf'))
+                except KeyError:
+                    assert (True)
+                break
+            expected_cost = find_shortest_path(OverriddenGraph(planner), path[0], finish)[1]
+            assert (path[-1] == finish and np.allclose(cost, expected_cost))
+            assert (np.allclose(sum(planner.cost(path[k], path[k + 1]) for k in range(len(path) - 1)),
+                                expected_cost))
@@ -1,3 +1,4 @@
+import os
 import numpy as np
 
 
@@ -80,6 +81,57 @@ class Graph:
         raise VertexNotFoundException
 
 
+# Read-only adjacency in compressed sparse row form, arrays are usually memory-mapped
+# .npy files so the search reads edges straight from disk
+class MemmapGraph:
+    def __init__(self, locations, offsets, neighbor_ids, weights):
+        self.locations = [tuple(location) for location in np.asarray(locations).tolist()]
+        self.ids = {location: index for index, location in enumerate(self.locations)}
+        self.num_vertices = len(self.locations)
+        self.offsets = offsets
+        self.neighbor_ids = neighbor_ids
+        self.weights = weights
+        self.row_id = None
+        self.row = {}
+
+    @classmethod
+    def load(cls, directory):
+        return cls(np.load(os.path.join(directory, 'vertices.npy')),
+                   np.load(os.path.join(directory, 'offsets.npy'), mmap_mode='r'),
+                   np.load(os.path.join(directory, 'neighbors.npy'), mmap_mode='r'),
+                   np.load(os.path.join(directory, 'weights.npy'), mmap_mode='r'))
+
+    def vertex_id(self, node_location):
+        if node_location in self.ids:
+            return self.ids[node_location]
+        raise VertexNotFoundException
+
+    # search asks for neighbors and then the cost of each of them, so the last row is kept decoded
+    def adjacent(self, node_location):
+        vertex_id = self.vertex_id(node_location)
+        if vertex_id != self.row_id:
+            begin, end = self.offsets[vertex_id], self.offsets[vertex_id + 1]
+            self.row = {self.locations[neighbor_id]: float(weight) for neighbor_id, weight
+                        in zip(self.neighbor_ids[begin:end].tolist(), self.weights[begin:end].tolist())}
+            self.row_id = vertex_id
+        return self.row
+
+    def vertices(self):
+        return list(self.locations)
+
+    def cost(self, from_node_location, to_node_location):
+        adjacent = self.adjacent(from_node_location)
+        if to_node_location in adjacent:
+            return adjacent[to_node_location]
+        raise VertexNotFoundException
+
+    def exists(self, from_node_location, to_node_location):
+        return from_node_location in self.ids and to_node_location in self.adjacent(from_node_location)
+
+    def neighbors(self, node_location):
+        return list(self.adjacent(node_location).keys())
+
+
 if __name__ == '__main__':
     g = Graph()
     a = (0, 0)
@@ -119,3 +171,13 @@ if __name__ == '__main__':
         g.neighbors((100, 100))
     except VertexNotFoundException:
         assert (True)
+
+    mg = MemmapGraph([a, b, c], np.array([0, 2, 3, 4]), np.array([1, 2, 0, 0]), np.array([1.5, 2.5, 1.5, 2.5]))
+    assert (mg.neighbors(a) == [b, c])
+    assert (mg.cost(a, c) == 2.5 and mg.cost(c, a) == 2.5)
+    assert (mg.exists(b, a) and not mg.exists(b, c) and not mg.exists(d, a))
+    try:
+        mg.cost(b, c)
+        assert (False)
+    except VertexNotFoundException:
+        assert (True)
@@ -1,3 +1,5 @@
+import hashlib
+import json
 import numpy as np
 from edge_limiter import guess_edge_limiter, edge_limiter_factory
 from graph import Graph, VertexNotFoundException
@@ -24,14 +26,20 @@ def find_closest_point(base, points):
     return points[min_index]
 
 
+# stable hash of the obstacle set, used to key caches and shared builds per map
+def obstacles_key(obstacles):
+    serialized = json.dumps([[[float(cord) for cord in point] for point in obstacle] for obstacle in obstacles])
+    return hashlib.sha1(serialized.encode()).hexdigest()
+
+
 class GraphExplorer():
     def __init__(self, robot_data, edge_limiter_name=None, is_report=False):
         self.graph = Graph()
         self.robot_data = robot_data
         self.edge_limiter_name = edge_limiter_name
         self.is_report = is_report
-        self.locations = [tuple(robot_data['start']),
-                          tuple(robot_data['finish']),
+        # start and finish may be left out to build the obstacle graph alone, see connect_locations
+        self.locations = [*[tuple(robot_data[name]) for name in ('start', 'finish') if name in robot_data],
                           *[tuple(item) for sublist in robot_data['obstacles'] for item in sublist]]
         self.obstacle_paths = self.get_obstacle_paths()
         # rename to shapes
@@ -132,9 +140,25 @@ class GraphExplorer():
                 if self.check_is_line_allowed_cached(line):
                     self.graph.add_edge(location_from, location_to)
 
+    # adds query points to an already explored graph, only their own edges are discovered
+    def connect_locations(self, locations):
+        for location in locations:
+            location = tuple(location)
+            if location in self.graph.vert_dict:
+                continue
+            existing_locations = self.graph.vertices()
+            self.graph.add_vertex(location)
+            self.locations.append(location)
+            for location_to in existing_locations:
+                line = (location, location_to)
+                if self.check_is_line_allowed_cached(line):
+                    self.graph.add_edge(location, location_to)
+
 
 if __name__ == '__main__':
     assert (find_closest_point((0, 0), [[2, 2], [2, 4], [3, 3]]) == [2, 2])
+    assert (obstacles_key([[[2, 2], [2, 4], [3, 3]]]) == obstacles_key([[(2.0, 2.0), (2.0, 4.0), (3.0, 3.0)]]))
+    assert (obstacles_key([[[2, 2], [2, 4], [3, 3]]]) != obstacles_key([[[2, 2], [2, 4], [3, 4]]]))
     # import json
     # set_cnt = 15
     # with open(f'tests/robot-test-{set_cnt}.json') as json_file:
@@ -179,6 +203,10 @@ if __name__ == '__main__':
         'obstacles': [[[2, 2], [2, 4], [3, 3]], [[5, 4], [4, 6], [6, 5], [7, 4]]]
     }).graph
     assert (len(graph.vertices()) == 9)
+    explorer = GraphExplorer({'obstacles': [[[2, 2], [2, 4], [3, 3]], [[5, 4], [4, 6], [6, 5], [7, 4]]]})
+    explorer.connect_locations([(0, 0), (10, 10)])
+    for location in graph.vertices():
+        assert (sorted(explorer.graph.neighbors(location)) == sorted(graph.neighbors(location)))
     assert (sorted(graph.neighbors((10, 10))) == [(4, 6), (6, 5), (7, 4)])
     assert (graph.cost((10, 10), (4, 6)) == np.sqrt((10 - 4) ** 2 + (10 - 6) ** 2))
     try:
@@ -0,0 +1,174 @@
+# Query-level result cache for robot_navigation.find_path
+#
+# Robots usually travel between a small set of docks and shelves, so the same
+# map is queried again and again with nearly identical start and finish points.
+# Results are keyed by the obstacle set hash and both endpoints snapped to a grid
+# of `tolerance` size. Before a cached polyline is returned its endpoints are
+# replaced with the exact query points and the first and last segments are
+# checked against the obstacles again, which is much cheaper than a rebuild.
+# A changed obstacle set hashes differently, so its old entries can never match
+# and simply age out of the LRU order.
+
+import sys
+from collections import OrderedDict
+
+import numpy as np
+
+from graph_explorer import obstacles_key
+from interception import calc_interception, NoInterceptionException
+from robot_navigation import find_path
+
+
+def snap(point, tolerance):
+    if not tolerance:
+        return tuple(float(cord) for cord in point)
+    return tuple(int(round(cord / tolerance)) for cord in point)
+
+
+def estimate_path_size(path):
+    return sys.getsizeof(path) + sum(sys.getsizeof(point) + sum(sys.getsizeof(cord) for cord in point)
+                                     for point in path)
+
+
+# the key (sha1 hex and two snapped points) outweighs a short dock to shelf path
+def estimate_entry_size(key, path):
+    map_key, start_key, finish_key = key
+    return sys.getsizeof(key) + sys.getsizeof(map_key) + estimate_path_size([start_key, finish_key]) \
+           + estimate_path_size(path)
+
+
+class PathCache:
+    def __init__(self, tolerance=1e-3, max_entries=1024, max_bytes=16 * 1024 * 1024, find_path=find_path):
+        self.tolerance = tolerance
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.compute_path = find_path
+        self.entries = OrderedDict()
+        self.size_bytes = 0
+        self.current_obstacles_key = None
+        self.obstacle_lines = []
+        self.stats = {'hits': 0, 'misses': 0, 'rejected': 0, 'evictions': 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def invalidate(self):
+        self.entries.clear()
+        self.size_bytes = 0
+
+    # obstacle lines of the last used map are kept for revalidation
+    def use_obstacles(self, obstacles):
+        key = obstacles_key(obstacles)
+        if key != self.current_obstacles_key:
+            self.current_obstacles_key = key
+            self.obstacle_lines = [np.array([obstacle[index - 1], obstacle[index]], dtype=float)
+                                   for obstacle in obstacles for index in range(len(obstacle))]
+        return key
+
+    def make_key(self, start, finish, obstacles):
+        return self.use_obstacles(obstacles), snap(start, self.tolerance), snap(finish, self.tolerance)
+
+    # same crossing rule GraphExplorer applies when it accepts an edge
+    def check_segment(self, segment):
+        for obstacle_line in self.obstacle_lines:
+            try:
+                if not calc_interception(segment, obstacle_line)[1]:
+                    return False
+            except NoInterceptionException:
+                continue
+        return True
+
+    def revalidate(self, path, start, finish):
+        path = [tuple(start), *path[1:-1], tuple(finish)]
+        first_segment = np.array(path[:2], dtype=float)
+        last_segment = np.array(path[-2:], dtype=float)
+        if self.check_segment(first_segment) and (len(path) == 2 or self.check_segment(last_segment)):
+            return path
+        return None
+
+    def get(self, start, finish, obstacles):
+        key = self.make_key(start, finish, obstacles)
+        if key not in self.entries:
+            self.stats['misses'] += 1
+            return None
+        path = self.revalidate(self.entries[key][0], start, finish)
+        if path is None:
+            self.stats['rejected'] += 1
+            self.stats['misses'] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats['hits'] += 1
+        return path
+
+    def put(self, start, finish, obstacles, path):
+        key = self.make_key(start, finish, obstacles)
+        if key in self.entries:
+            self.size_bytes -= self.entries.pop(key)[1]
+        size = estimate_entry_size(key, path)
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (list(path), size)
+        self.size_bytes += size
+        while len(self.entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size_bytes -= evicted_size
+            self.stats['evictions'] += 1
+
+    def find_path(self, start, finish, obstacles=[]):
+        path = self.get(start, finish, obstacles)
+        if path is not None:
+            return path
+        path = self.compute_path(start, finish, obstacles)
+        self.put(start, finish, obstacles, path)
+        return path
+
+
+if __name__ == '__main__':
+    obstacles = [[[2, 2], [2, 4], [3, 3]], [[5, 4], [4, 6], [6, 5], [7, 4]]]
+    calls = []
+
+
+    def counting_find_path(start, finish, obstacles=[]):
+        calls.append((tuple(start), tuple(finish)))
+        return find_path(start, finish, obstacles)
+
+
+    assert (snap((1.0004, 2.0), 1e-3) == snap((0.9996, 2.0), 1e-3) == (1000, 2000))
+    assert (snap((1.5, 2), 0) == (1.5, 2.0))
+
+    cache = PathCache(tolerance=1e-2, find_path=counting_find_path)
+    path = cache.find_path([0, 0], [10, 10], obstacles)
+    assert (path == [(0, 0), (2, 4), (4, 6), (10, 10)])
+    assert (cache.find_path([0.001, 0], [10, 10.002], obstacles) == [(0.001, 0), (2, 4), (4, 6), (10, 10.002)])
+    assert (len(calls) == 1 and cache.stats['hits'] == 1 and cache.stats['misses'] == 1)
+
+    # the cached route would cross the obstacle from the new start, so it is rebuilt
+    cache.entries[next(iter(cache.entries))] = ([(0, 0), (10, 10)], 0)
+    assert (cache.find_path([0, 0], [10, 10], obstacles) == path)
+    assert (cache.stats['rejected'] == 1 and len(calls) == 2)
+
+    # alternating maps keep each other's entries, a changed map never matches old ones
+    other_obstacles = [[[2, 2], [2, 4], [3, 3]]]
+    cache.find_path([0, 0], [10, 10], other_obstacles)
+    assert (len(cache) == 2 and len(calls) == 3)
+    assert (cache.find_path([0, 0], [10, 10], obstacles) == path)
+    assert (cache.find_path([0, 0], [10, 10], other_obstacles) == [(0, 0), (10, 10)])
+    assert (len(calls) == 3)
+    cache.invalidate()
+    assert (len(cache) == 0 and cache.size_bytes == 0)
+
+    cache = PathCache(tolerance=1e-2, max_entries=2)
+    for finish in ([10, 10], [10, 11], [10, 12]):
+        cache.find_path([0, 0], finish, obstacles)
+    assert (len(cache) == 2 and cache.stats['evictions'] == 1)
+    assert (cache.get([0, 0], [10, 10], obstacles) is None)
+    assert (cache.get([0, 0], [10, 12], obstacles) is not None)
+
+    cache = PathCache()
+    entry_size = estimate_entry_size(cache.make_key([0, 0], [10, 10], obstacles), path)
+    assert (entry_size > estimate_path_size(path))
+    cache = PathCache(max_bytes=entry_size + 1)
+    cache.find_path([0, 0], [10, 10], obstacles)
+    assert (len(cache) == 1 and cache.size_bytes == entry_size)
+    cache.find_path([0, 0], [10, 10.5], obstacles)
+    assert (len(cache) == 1 and cache.size_bytes <= cache.max_bytes)
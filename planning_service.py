@@ -0,0 +1,473 @@
+# Local asyncio planning service around robot_navigation.find_path
+#
+#      > python planning_service.py 127.0.0.1 8765
+#      > python planning_service.py /tmp/robot-navigation.sock
+#
+# Requests are POST /path with a json body
+#   {"start": [x, y], "finish": [x, y], "obstacles": [...], "deadline": seconds}
+# and the response body is {"path": [[x, y], ...]} or {"error": "..."}.
+#
+# Requests for the same map share one obstacle graph build and only connect their
+# own start and finish to it. When the map is large enough for the auto edge
+# limiter, whose edges depend on start and finish, only identical queries share a
+# build. Graph building and search run in a process pool so the event loop
+# stays responsive, open connections and distinct jobs waiting for the pool are
+# bounded, slow clients are cut off by a read timeout and every request may carry
+# its own deadline.
+
+import asyncio
+import json
+import math
+import sys
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from dijkstra import find_shortest_path
+from edge_limiter import guess_edge_limiter
+from graph_explorer import GraphExplorer, obstacles_key
+from robot_navigation import find_path
+
+
+class ServiceOverloadedException(Exception):
+    pass
+
+
+class DeadlineExceededException(Exception):
+    pass
+
+
+class PlanningServiceException(Exception):
+    pass
+
+
+class MalformedRequestException(Exception):
+    pass
+
+
+HTTP_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    408: 'Request Timeout',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def is_point(value):
+    return isinstance(value, list) and len(value) == 2 and all(is_number(cord) for cord in value)
+
+
+# checked before anything reaches the pool, so client mistakes neither cost a build nor a pending slot
+def validate_request(start, finish, obstacles, deadline):
+    if not is_point(start):
+        return 'start must be a list of two numbers'
+    if not is_point(finish):
+        return 'finish must be a list of two numbers'
+    if not isinstance(obstacles, list) or not all(isinstance(obstacle, list) and all(is_point(point) for point in obstacle)
+                                                  for obstacle in obstacles):
+        return 'obstacles must be a list of lists of points'
+    if deadline is not None and not (is_number(deadline) and deadline >= 0):
+        return 'deadline must be a non-negative number'
+    return None
+
+
+def request_key(start, finish, obstacles):
+    return (obstacles_key(obstacles),
+            tuple(float(cord) for cord in start),
+            tuple(float(cord) for cord in finish))
+
+
+# without an edge limiter the obstacle to obstacle edges do not depend on start and finish
+def is_graph_shareable(obstacles):
+    return guess_edge_limiter(2 + sum(len(obstacle) for obstacle in obstacles)) is None
+
+
+def plan_path(start, finish, obstacles):
+    path = find_path(start, finish, obstacles)
+    return [[float(cord) for cord in point] for point in path]
+
+
+def build_obstacle_graph(obstacles):
+    explorer = GraphExplorer({'obstacles': obstacles})
+    # the explorer is sent back to the service, new query lines never hit the old entries
+    explorer.interceptions_cache = {}
+    return explorer
+
+
+def plan_path_on_graph(explorer, start, finish):
+    explorer.connect_locations([start, finish])
+    path, cost = find_shortest_path(explorer.graph, tuple(start), tuple(finish))
+    return [[float(cord) for cord in point] for point in path]
+
+
+class PlanningService:
+    def __init__(self, max_workers=None, max_pending=64, max_connections=256, read_timeout=10,
+                 max_body_bytes=16 * 1024 * 1024, max_graphs=16, default_deadline=None, executor=None):
+        self.executor = executor if executor is not None else ProcessPoolExecutor(max_workers=max_workers)
+        self.max_pending = max_pending
+        # bounds open connections, and with them the number of coalesced waiters
+        self.connections = asyncio.Semaphore(max_connections)
+        self.read_timeout = read_timeout
+        self.max_body_bytes = max_body_bytes
+        self.default_deadline = default_deadline
+        self.in_flight = {}
+        self.graph_builds = {}
+        self.waiters = {}
+        # obstacle graphs of recently used maps, shared by queries with any start and finish
+        self.graphs = OrderedDict()
+        self.max_graphs = max_graphs
+        self.stats = {'requests': 0, 'builds': 0, 'graph_builds': 0, 'coalesced': 0, 'rejected': 0,
+                      'timeouts': 0, 'shed': 0, 'refused_connections': 0, 'read_timeouts': 0}
+        self.server = None
+
+    def release(self, jobs, key, future):
+        if jobs.get(key) is future:
+            del jobs[key]
+            del self.waiters[future]
+
+    def schedule(self, jobs, key, create, max_jobs=None):
+        future = jobs.get(key)
+        if future is not None:
+            return future, False
+        if max_jobs is not None and len(jobs) >= max_jobs:
+            self.stats['rejected'] += 1
+            raise ServiceOverloadedException(f'{len(jobs)} jobs pending')
+        future = create()
+        jobs[key] = future
+        self.waiters[future] = 0
+        future.add_done_callback(lambda _: self.release(jobs, key, future))
+        return future, True
+
+    async def wait(self, jobs, key, future, deadline):
+        self.waiters[future] += 1
+        try:
+            # shield keeps the shared job alive for other waiters when this one times out
+            return await asyncio.wait_for(asyncio.shield(future), deadline)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            raise DeadlineExceededException(f'no path within {deadline}s')
+        finally:
+            if jobs.get(key) is future:
+                self.waiters[future] -= 1
+                # nobody waits any more: drop the job if it has not started and free its slot
+                if self.waiters[future] == 0 and not future.done():
+                    self.stats['shed'] += 1
+                    future.cancel()
+                    self.release(jobs, key, future)
+
+    async def obstacle_graph(self, obstacles):
+        key = obstacles_key(obstacles)
+        if key in self.graphs:
+            self.graphs.move_to_end(key)
+            return self.graphs[key]
+        loop = asyncio.get_running_loop()
+        # graph builds are only started by pending queries, max_pending already bounds them
+        future, is_new = self.schedule(self.graph_builds, key,
+                                       lambda: loop.run_in_executor(self.executor, build_obstacle_graph, obstacles))
+        if is_new:
+            self.stats['graph_builds'] += 1
+        explorer = await self.wait(self.graph_builds, key, future, None)
+        self.graphs[key] = explorer
+        while len(self.graphs) > self.max_graphs:
+            self.graphs.popitem(last=False)
+        return explorer
+
+    async def plan_on_shared_graph(self, start, finish, obstacles):
+        explorer = await self.obstacle_graph(obstacles)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, plan_path_on_graph, explorer, start, finish)
+
+    def create_job(self, start, finish, obstacles):
+        if is_graph_shareable(obstacles):
+            return asyncio.ensure_future(self.plan_on_shared_graph(start, finish, obstacles))
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self.executor, plan_path, start, finish, obstacles)
+
+    async def find_path(self, start, finish, obstacles=[], deadline=None):
+        self.stats['requests'] += 1
+        key = request_key(start, finish, obstacles)
+        future, is_new = self.schedule(self.in_flight, key, lambda: self.create_job(start, finish, obstacles),
+                                       self.max_pending)
+        self.stats['builds' if is_new else 'coalesced'] += 1
+        if deadline is None:
+            deadline = self.default_deadline
+        return await self.wait(self.in_flight, key, future, deadline)
+
+    async def handle_request(self, method, target, body):
+        if method != 'POST' or target != '/path':
+            return 404, {'error': f'{method} {target} is not supported'}
+        try:
+            data = json.loads(body)
+            start, finish = data['start'], data['finish']
+            obstacles = data.get('obstacles', [])
+            deadline = data.get('deadline')
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            return 400, {'error': f'malformed request: {e!r}'}
+        error = validate_request(start, finish, obstacles, deadline)
+        if error is not None:
+            return 400, {'error': f'malformed request: {error}'}
+        try:
+            return 200, {'path': await self.find_path(start, finish, obstacles, deadline)}
+        except ServiceOverloadedException as e:
+            return 503, {'error': str(e)}
+        except DeadlineExceededException as e:
+            return 504, {'error': str(e)}
+        except Exception as e:
+            return 500, {'error': repr(e)}
+
+    async def read_request(self, reader):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = await read_headers(reader)
+        except ValueError:
+            # StreamReader refuses lines over its limit
+            raise MalformedRequestException('request line or header too long')
+        content_length = headers.get('content-length', '0')
+        if not content_length.isdecimal():
+            raise MalformedRequestException(f'invalid Content-Length {content_length!r}')
+        content_length = int(content_length)
+        if content_length > self.max_body_bytes:
+            return request_line, None
+        return request_line, await reader.readexactly(content_length)
+
+    async def respond(self, reader):
+        try:
+            request_line, body = await asyncio.wait_for(self.read_request(reader), self.read_timeout)
+        except asyncio.TimeoutError:
+            self.stats['read_timeouts'] += 1
+            return 408, {'error': f'request not received within {self.read_timeout}s'}
+        except MalformedRequestException as e:
+            return 400, {'error': f'malformed request: {e}'}
+        if body is None:
+            return 413, {'error': f'body larger than {self.max_body_bytes} bytes'}
+        if len(request_line) < 2:
+            return 400, {'error': 'malformed request line'}
+        return await self.handle_request(request_line[0], request_line[1], body)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            if self.connections.locked():
+                self.stats['refused_connections'] += 1
+                status, payload = 503, {'error': 'too many open connections'}
+            else:
+                async with self.connections:
+                    status, payload = await self.respond(reader)
+            writer.write(encode_message(f'HTTP/1.1 {status} {HTTP_REASONS[status]}', payload))
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=0, unix_path=None):
+        if unix_path is not None:
+            self.server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+        else:
+            self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    def address(self):
+        return self.server.sockets[0].getsockname()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        # waiting for the pool off the loop keeps its exit hook from writing to a closed pipe
+        await asyncio.get_running_loop().run_in_executor(None, partial(self.executor.shutdown, cancel_futures=True))
+
+
+async def read_headers(reader):
+    headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            return headers
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+def encode_message(first_line, payload):
+    body = json.dumps(payload).encode()
+    head = f'{first_line}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n'
+    return head.encode('latin-1') + body
+
+
+class PlanningClient:
+    def __init__(self, host='127.0.0.1', port=8765, unix_path=None):
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+
+    async def open_connection(self):
+        if self.unix_path is not None:
+            return await asyncio.open_unix_connection(self.unix_path)
+        return await asyncio.open_connection(self.host, self.port)
+
+    async def find_path(self, start, finish, obstacles=[], deadline=None):
+        payload = {'start': list(start), 'finish': list(finish), 'obstacles': obstacles}
+        if deadline is not None:
+            payload['deadline'] = deadline
+        reader, writer = await self.open_connection()
+        try:
+            writer.write(encode_message(f'POST /path HTTP/1.1\r\nHost: {self.host}', payload))
+            await writer.drain()
+            status = int((await reader.readline()).decode('latin-1').split()[1])
+            headers = await read_headers(reader)
+            data = json.loads(await reader.readexactly(int(headers['content-length'])))
+        finally:
+            writer.close()
+
+        if status == 200:
+            return [tuple(point) for point in data['path']]
+        if status == 503:
+            raise ServiceOverloadedException(data['error'])
+        if status == 504:
+            raise DeadlineExceededException(data['error'])
+        raise PlanningServiceException(f'{status}: {data["error"]}')
+
+
+async def serve(host='127.0.0.1', port=8765, unix_path=None, **kwargs):
+    service = PlanningService(**kwargs)
+    server = await service.start(host, port, unix_path)
+    print('planning service listening on', service.address())
+    try:
+        await server.serve_forever()
+    finally:
+        await service.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 2:
+        asyncio.run(serve(unix_path=sys.argv[1]))
+        exit(0)
+    if len(sys.argv) == 3:
+        asyncio.run(serve(sys.argv[1], int(sys.argv[2])))
+        exit(0)
+
+    import os
+    import tempfile
+    import numpy as np
+
+
+    def calc_cost_from_path(path):
+        return sum(np.linalg.norm(np.array(path[index]) - np.array(path[index - 1])) for index in range(1, len(path)))
+
+
+    with open('tests/robot-test-5.json') as json_file:
+        data = json.load(json_file)
+    with open('tests/robot-test-15.json') as json_file:
+        other_data = json.load(json_file)
+
+
+    async def run_checks(client, service):
+        paths = await asyncio.gather(*[client.find_path(data['start'], data['finish'], data['obstacles'])
+                                       for _ in range(8)])
+        assert (all(path == paths[0] for path in paths))
+        assert (paths[0][0] == tuple(data['start']) and paths[0][-1] == tuple(data['finish']))
+        assert (paths[0] == [tuple(point) for point in plan_path(data['start'], data['finish'], data['obstacles'])])
+        assert (service.stats['builds'] == 1 and service.stats['coalesced'] == 7)
+        assert (service.stats['graph_builds'] == 1)
+
+        # other routes on the same map only connect their endpoints to the shared obstacle graph
+        finishes = [[3, 9], [12, 1], [6, 10]]
+        routes = await asyncio.gather(*[client.find_path(data['start'], finish, data['obstacles'])
+                                        for finish in finishes])
+        assert (service.stats['builds'] == 4 and service.stats['graph_builds'] == 1)
+        for finish, route in zip(finishes, routes):
+            expected = plan_path(data['start'], finish, data['obstacles'])
+            assert (route[0] == tuple(data['start']) and route[-1] == tuple(finish))
+            assert (np.allclose(calc_cost_from_path(route), calc_cost_from_path(expected)))
+
+        try:
+            await client.find_path(data['start'], data['finish'], data['obstacles'], deadline=0)
+            assert (False)
+        except DeadlineExceededException:
+            assert (True)
+
+        service.max_pending = 1
+        results = await asyncio.gather(
+            client.find_path(data['start'], data['finish'], data['obstacles']),
+            client.find_path(other_data['start'], other_data['finish'], other_data['obstacles']),
+            return_exceptions=True)
+        assert (sum(isinstance(result, ServiceOverloadedException) for result in results) == 1)
+
+        builds = service.stats['builds']
+        for start, finish, obstacles, deadline in (([0, 0], [1], [], None),
+                                                   ('ab', [1, 1], [], None),
+                                                   ([0, 0], [1, 1], [[[0, 'x']]], None),
+                                                   ([0, 0], [1, 1], [], '5'),
+                                                   ([0, 0], [1, 1], [], -1)):
+            try:
+                await client.find_path(start, finish, obstacles, deadline)
+                assert (False)
+            except PlanningServiceException as e:
+                assert (str(e).startswith('400'))
+        assert (service.stats['builds'] == builds)
+
+
+    async def main():
+        service = PlanningService(max_workers=2)
+        await service.start()
+        host, port = service.address()[:2]
+        await run_checks(PlanningClient(host, port), service)
+        await service.close()
+
+        # once every waiter gave up the jobs stop holding pending slots
+        service = PlanningService(max_workers=1, max_pending=2)
+        results = await asyncio.gather(*[service.find_path(*request, deadline=0.05) for request in (
+            (data['start'], data['finish'], data['obstacles']),
+            (other_data['start'], other_data['finish'], other_data['obstacles']))], return_exceptions=True)
+        assert (all(isinstance(result, DeadlineExceededException) for result in results))
+        # the shared graph builds are shed once the cancelled query tasks unwind
+        assert (not service.in_flight and service.stats['shed'] >= 2)
+        assert (await service.find_path([0, 0], [1, 1], []) == [[0.0, 0.0], [1.0, 1.0]])
+        await service.close()
+
+        service = PlanningService(max_workers=1, max_connections=1, read_timeout=0.5)
+        await service.start()
+        host, port = service.address()[:2]
+        # broken framing is answered instead of silently dropping the connection
+        for raw_request in (b'POST /path HTTP/1.1\r\nContent-Length: abc\r\n\r\n',
+                            b'POST /path HTTP/1.1\r\nContent-Length: -5\r\n\r\n',
+                            b'POST /' + b'x' * (1 << 17) + b' HTTP/1.1\r\n\r\n'):
+            raw_reader, raw_writer = await asyncio.open_connection(host, port)
+            raw_writer.write(raw_request)
+            await raw_writer.drain()
+            assert ((await raw_reader.readline()).split()[1] == b'400')
+            raw_writer.close()
+
+        # a client that announces a body and stalls holds the only connection slot
+        stalled_reader, stalled_writer = await asyncio.open_connection(host, port)
+        stalled_writer.write(b'POST /path HTTP/1.1\r\nContent-Length: 1000000\r\n\r\n')
+        await stalled_writer.drain()
+        await asyncio.sleep(0.1)
+        try:
+            await PlanningClient(host, port).find_path([0, 0], [10, 10], [])
+            assert (False)
+        except ServiceOverloadedException:
+            assert (True)
+        assert ((await stalled_reader.readline()).split()[1] == b'408')
+        stalled_writer.close()
+        assert (await PlanningClient(host, port).find_path([0, 0], [10, 10], []) == [(0.0, 0.0), (10.0, 10.0)])
+        assert (service.stats['refused_connections'] == 1 and service.stats['read_timeouts'] == 1)
+        await service.close()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            unix_path = os.path.join(tmp_dir, 'planning.sock')
+            service = PlanningService(max_workers=2)
+            await service.start(unix_path=unix_path)
+            assert (await PlanningClient(unix_path=unix_path).find_path([0, 0], [10, 10], [])
+                    == [(0.0, 0.0), (10.0, 10.0)])
+            await service.close()
+
+
+    asyncio.run(main())
@@ -13,14 +13,20 @@ import json
 
 from dijkstra import find_shortest_path
 from graph_explorer import GraphExplorer
+from streaming_graph_explorer import StreamingGraphExplorer
 
 
-def find_path(start, finish, obstacles=[]):
-	explorer = GraphExplorer({
+def find_path(start, finish, obstacles=[], work_dir=None):
+	robot_data = {
 		'start': start,
 		'finish': finish,
 		'obstacles': obstacles,
-	}, edge_limiter_name='auto')
+	}
+	if work_dir is None:
+		explorer = GraphExplorer(robot_data, edge_limiter_name='auto')
+	else:
+		# edges are streamed to work_dir and searched from memory-mapped files
+		explorer = StreamingGraphExplorer(robot_data, work_dir, edge_limiter_name='auto')
 
 	path, cost = find_shortest_path(explorer.graph, tuple(start), tuple(finish))
 
@@ -0,0 +1,223 @@
+# Out-of-core variant of GraphExplorer for maps whose edges do not fit in memory
+#
+# Source vertices are processed in chunks. Edges accepted in a chunk are appended
+# to `edges.bin` as (int32 from, int32 to, float64 weight) records and
+# `manifest.json` is updated after every chunk, so an interrupted construction
+# resumes from the last finished chunk. When all chunks are done the edge file is
+# compacted chunk by chunk into CSR arrays (`offsets.npy`, `neighbors.npy`,
+# `weights.npy`) which MemmapGraph reads directly from disk.
+
+import json
+import os
+import numpy as np
+from graph import MemmapGraph
+from graph_explorer import GraphExplorer, obstacles_key
+from interception import calc_interception
+
+EDGE_DTYPE = np.dtype([('from', '<i4'), ('to', '<i4'), ('weight', '<f8')])
+
+
+def write_json_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as json_file:
+        json.dump(data, json_file)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def calc_weights(points, from_ids, to_ids):
+    return np.linalg.norm(points[from_ids] - points[to_ids], axis=1)
+
+
+def compact_edges(edge_path, vertices_cnt, edge_count, directory, chunk_size=1 << 20):
+    edges = np.memmap(edge_path, dtype=EDGE_DTYPE, mode='r', shape=(edge_count,)) if edge_count else []
+
+    # first pass counts degrees, every edge is stored in both directions
+    degrees = np.zeros(vertices_cnt, dtype=np.int64)
+    for begin in range(0, edge_count, chunk_size):
+        chunk = edges[begin:begin + chunk_size]
+        degrees += np.bincount(chunk['from'], minlength=vertices_cnt)
+        degrees += np.bincount(chunk['to'], minlength=vertices_cnt)
+    offsets = np.zeros(vertices_cnt + 1, dtype=np.int64)
+    np.cumsum(degrees, out=offsets[1:])
+
+    np.save(os.path.join(directory, 'offsets.npy'), offsets)
+    neighbor_ids = np.lib.format.open_memmap(os.path.join(directory, 'neighbors.npy'), mode='w+',
+                                             dtype=np.int32, shape=(2 * edge_count,))
+    weights = np.lib.format.open_memmap(os.path.join(directory, 'weights.npy'), mode='w+',
+                                        dtype=np.float64, shape=(2 * edge_count,))
+
+    # second pass scatters each chunk into the rows, cursor keeps the next free slot per vertex
+    cursor = offsets[:-1].copy()
+    for begin in range(0, edge_count, chunk_size):
+        chunk = edges[begin:begin + chunk_size]
+        sources = np.concatenate([chunk['from'], chunk['to']])
+        targets = np.concatenate([chunk['to'], chunk['from']])
+        chunk_weights = np.concatenate([chunk['weight'], chunk['weight']])
+        order = np.argsort(sources, kind='stable')
+        sources = sources[order]
+        group_starts = np.searchsorted(sources, sources, side='left')
+        positions = cursor[sources] + np.arange(len(sources)) - group_starts
+        neighbor_ids[positions] = targets[order]
+        weights[positions] = chunk_weights[order]
+        cursor += np.bincount(sources, minlength=vertices_cnt)
+
+    neighbor_ids.flush()
+    weights.flush()
+    del neighbor_ids, weights, edges
+
+
+class StreamingGraphExplorer(GraphExplorer):
+    def __init__(self, robot_data, directory, chunk_size=64, edge_limiter_name=None, is_report=False):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        os.makedirs(directory, exist_ok=True)
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+        self.edge_path = os.path.join(directory, 'edges.bin')
+        super().__init__(robot_data, edge_limiter_name, is_report)
+
+    def build_key(self):
+        return {
+            'obstacles': obstacles_key(self.robot_data['obstacles']),
+            'start': [float(cord) for cord in self.robot_data['start']],
+            'finish': [float(cord) for cord in self.robot_data['finish']],
+            'edge_limiter': self.edge_limiter_name,
+            'chunk_size': self.chunk_size,
+        }
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return None
+        with open(self.manifest_path) as json_file:
+            manifest = json.load(json_file)
+        if manifest.get('key') != self.build_key():
+            return None
+        return manifest
+
+    def init_graph(self):
+        # locations may repeat (closed polygons, shared vertices), edges are stored per unique vertex
+        self.vertex_locations = list(dict.fromkeys(self.locations))
+        self.vertex_ids = {location: index for index, location in enumerate(self.vertex_locations)}
+        self.points = np.array(self.vertex_locations, dtype=float)
+        self.obstacle_edges = set()
+        for obstacle in self.obstacle_paths:
+            for line in obstacle:
+                from_id, to_id = self.vertex_ids[tuple(line[0])], self.vertex_ids[tuple(line[1])]
+                if from_id != to_id:
+                    self.obstacle_edges.add((min(from_id, to_id), max(from_id, to_id)))
+
+    # every candidate line is tested once, caching its interceptions would only grow memory
+    def calc_interception(self, line1, line2):
+        return calc_interception(line1, line2)
+
+    def check_is_line_allowed_cached(self, line):
+        from_id, to_id = self.vertex_ids[line[0]], self.vertex_ids[line[1]]
+        return (min(from_id, to_id), max(from_id, to_id)) not in self.obstacle_edges \
+               and not self.edge_limiter(line, self.robot_data) \
+               and not self.check_is_line_on_obstacle(line) \
+               and not self.find_interceptions(np.array(line))
+
+    def discover_chunk_edges(self, chunk_index):
+        from_ids, to_ids = [], []
+        chunk_begin = chunk_index * self.chunk_size
+        for location_from_index in range(chunk_begin, min(chunk_begin + self.chunk_size, len(self.vertex_locations))):
+            location_from = self.vertex_locations[location_from_index]
+            for location_to_index in range(location_from_index + 1, len(self.vertex_locations)):
+                line = (location_from, self.vertex_locations[location_to_index])
+                if self.check_is_line_allowed_cached(line):
+                    from_ids.append(location_from_index)
+                    to_ids.append(location_to_index)
+        return np.array(from_ids, dtype=np.int32), np.array(to_ids, dtype=np.int32)
+
+    def write_edges(self, edge_file, from_ids, to_ids):
+        edges = np.empty(len(from_ids), dtype=EDGE_DTYPE)
+        edges['from'] = from_ids
+        edges['to'] = to_ids
+        edges['weight'] = calc_weights(self.points, from_ids, to_ids)
+        edge_file.write(edges.tobytes())
+        edge_file.flush()
+        os.fsync(edge_file.fileno())
+        return len(edges)
+
+    def discover_edges(self):
+        chunks_cnt = (len(self.vertex_locations) + self.chunk_size - 1) // self.chunk_size
+        manifest = self.read_manifest()
+        if manifest is None:
+            np.save(os.path.join(self.directory, 'vertices.npy'), self.points)
+            open(self.edge_path, 'wb').close()
+            manifest = {'key': self.build_key(), 'chunks_done': 0, 'edge_count': 0, 'compacted': False}
+            obstacle_edges = np.array(sorted(self.obstacle_edges), dtype=np.int32).reshape(-1, 2)
+            with open(self.edge_path, 'ab') as edge_file:
+                manifest['edge_count'] = self.write_edges(edge_file, obstacle_edges[:, 0], obstacle_edges[:, 1])
+            write_json_atomic(self.manifest_path, manifest)
+
+        if not manifest['compacted']:
+            # drop records of a chunk that was interrupted before the manifest caught up
+            with open(self.edge_path, 'r+b') as edge_file:
+                edge_file.truncate(manifest['edge_count'] * EDGE_DTYPE.itemsize)
+            with open(self.edge_path, 'ab') as edge_file:
+                for chunk_index in range(manifest['chunks_done'], chunks_cnt):
+                    if self.is_report:
+                        print('edging progress', 100 * chunk_index / chunks_cnt)
+                    from_ids, to_ids = self.discover_chunk_edges(chunk_index)
+                    manifest['edge_count'] += self.write_edges(edge_file, from_ids, to_ids)
+                    manifest['chunks_done'] = chunk_index + 1
+                    write_json_atomic(self.manifest_path, manifest)
+            compact_edges(self.edge_path, len(self.vertex_locations), manifest['edge_count'], self.directory)
+            manifest['compacted'] = True
+            write_json_atomic(self.manifest_path, manifest)
+
+        self.graph = MemmapGraph.load(self.directory)
+
+
+if __name__ == '__main__':
+    import tempfile
+    from dijkstra import find_shortest_path
+
+    data = {
+        'start': [0, 0],
+        'finish': [10, 10],
+        'obstacles': [[[2, 2], [2, 4], [3, 3]], [[5, 4], [4, 6], [6, 5], [7, 4]]]
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        graph = StreamingGraphExplorer(data, tmp_dir, chunk_size=2).graph
+        reference = GraphExplorer(data).graph
+        assert (len(graph.vertices()) == 9)
+        assert (sorted(graph.neighbors((10, 10))) == [(4, 6), (6, 5), (7, 4)])
+        assert (graph.cost((10, 10), (4, 6)) == np.sqrt((10 - 4) ** 2 + (10 - 6) ** 2))
+        for location in reference.vertices():
+            assert (sorted(graph.neighbors(location)) == sorted(reference.neighbors(location)))
+        assert (find_shortest_path(graph, (0, 0), (10, 10))[0] == [(0, 0), (2, 4), (4, 6), (10, 10)])
+
+
+    class InterruptedExplorer(StreamingGraphExplorer):
+        def discover_chunk_edges(self, chunk_index):
+            if chunk_index == 2:
+                raise KeyboardInterrupt
+            return super().discover_chunk_edges(chunk_index)
+
+
+    with open('tests/robot-test-5.json') as json_file:
+        data = json.load(json_file)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            InterruptedExplorer(data, tmp_dir, chunk_size=8, edge_limiter_name='auto')
+            assert (False)
+        except KeyboardInterrupt:
+            assert (True)
+        with open(os.path.join(tmp_dir, 'manifest.json')) as json_file:
+            assert (json.load(json_file)['chunks_done'] == 2)
+        # a half written chunk must be discarded on resume
+        with open(os.path.join(tmp_dir, 'edges.bin'), 'ab') as edge_file:
+            edge_file.write(b'\0' * EDGE_DTYPE.itemsize * 3)
+
+        explorer = StreamingGraphExplorer(data, tmp_dir, chunk_size=8, edge_limiter_name='auto')
+        assert (not explorer.interceptions_cache)
+        graph = explorer.graph
+        reference = GraphExplorer(data, edge_limiter_name='auto').graph
+        for location in reference.vertices():
+            assert (sorted(graph.neighbors(location)) == sorted(set(reference.neighbors(location)) - {location}))
+        start, finish = tuple(data['start']), tuple(data['finish'])
+        path, cost = find_shortest_path(graph, start, finish)
+        assert (np.allclose(cost, find_shortest_path(reference, start, finish)[1]))